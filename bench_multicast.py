@@ -0,0 +1,226 @@
+import argparse
+import contextlib
+import io
+import os
+import queue
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+from client import BLOCK_SIZE, CHANNELS, VoiceClient
+from common import MCAST_TIMEOUT, PING_INTERVAL
+from server import VoiceRelayServer
+
+LOOPBACK = "127.0.0.1"
+
+
+class CountingSocket:
+    # 统计接收字节数，其余操作原样转发；中继发给各客户端的字节之和即服务端出口字节
+    def __init__(self, sock: socket.socket):
+        self._sock = sock
+        self.received = 0
+
+    def recv(self, n: int) -> bytes:
+        data = self._sock.recv(n)
+        self.received += len(data)
+        return data
+
+    def recvfrom(self, n: int) -> tuple[bytes, tuple]:
+        data, addr = self._sock.recvfrom(n)
+        self.received += len(data)
+        return data, addr
+
+    def __getattr__(self, name: str):
+        return getattr(self._sock, name)
+
+
+class BenchClient(VoiceClient):
+    # 真实 VoiceClient 的网络线程（JOIN、组播确认/回退、去重、自身帧过滤），只是不打开声卡：
+    # 采集由 feed_frame 驱动 _input_callback，播放端只计数不入队
+    def __init__(self, port: int, name: str, multicast: bool):
+        self.messages: list[str] = []
+        super().__init__(LOOPBACK, port, "bench", name, on_system_message=self.messages.append, multicast=multicast)
+        self.delivered = 0
+        self._silence = np.zeros((BLOCK_SIZE, CHANNELS), dtype=np.int16)
+        self.sock = CountingSocket(self.sock)
+        self.mcast_counter: CountingSocket | None = None
+        self._start_network()
+
+    def _mcast_loop(self, label: str) -> None:
+        self.mcast_counter = self.mcast_sock = CountingSocket(self.mcast_sock)
+        super()._mcast_loop(label)
+
+    def received_bytes(self) -> tuple[int, int]:
+        mcast = self.mcast_counter.received if self.mcast_counter is not None else 0
+        return self.sock.received, mcast
+
+    def _put_latest_frame(self, target_queue: queue.Queue[bytes], frame: bytes) -> bool:
+        if target_queue is self.play_queue:
+            self.delivered += 1
+            return False
+        return VoiceClient._put_latest_frame(target_queue, frame)
+
+    def feed_frame(self) -> None:
+        self._input_callback(self._silence, BLOCK_SIZE, None, 0)
+
+
+def _wait_for(predicate, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return predicate()
+
+
+def _wait_for_server(port: int, timeout: float = 5.0) -> None:
+    def _accepting() -> bool:
+        try:
+            socket.create_connection((LOOPBACK, port), timeout=0.2).close()
+            return True
+        except OSError:
+            return False
+
+    if not _wait_for(_accepting, timeout):
+        raise RuntimeError(f"server did not start on port {port}")
+
+
+def _children_cpu() -> float:
+    t = os.times()
+    return t.children_user + t.children_system
+
+
+def _egress_bytes(clients: list[BenchClient]) -> int:
+    counts = [c.received_bytes() for c in clients]
+    # TCP 按客户端逐个发送；组播每帧只发一次，任一客户端收到的字节数即组播出口字节
+    return sum(tcp for tcp, _ in counts) + max(mcast for _, mcast in counts)
+
+
+def _stream(talker: BenchClient, frames: int, interval: float) -> None:
+    started = time.perf_counter()
+    for i in range(frames):
+        talker.feed_frame()
+        delay = started + (i + 1) * interval - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _join_room(port: int, listeners: int, multicast: bool) -> tuple[BenchClient, list[BenchClient]]:
+    # 发送端也加入组播组，用于验证客户端能过滤掉自己的帧
+    talker = BenchClient(port, "talker", multicast)
+    peers = [BenchClient(port, f"listener{i}", multicast) for i in range(listeners)]
+    clients = [talker] + peers
+    if multicast and not _wait_for(lambda: all(c.mcast_enabled for c in clients), MCAST_TIMEOUT):
+        raise RuntimeError("multicast probe not received on loopback")
+    time.sleep(0.3)
+    return talker, peers
+
+
+def run_mode(multicast: bool, port: int, listeners: int, frames: int, interval: float) -> dict:
+    cmd = [sys.executable, "server.py", "--host", LOOPBACK, "--port", str(port)]
+    if multicast:
+        cmd += ["--multicast", "--multicast-if", LOOPBACK]
+    cpu_before = _children_cpu()
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, cwd=os.path.dirname(os.path.abspath(__file__)))
+    try:
+        _wait_for_server(port)
+        talker, peers = _join_room(port, listeners, multicast)
+        egress_before = _egress_bytes([talker] + peers)
+        _stream(talker, frames, interval)
+        time.sleep(0.5)
+        egress = _egress_bytes([talker] + peers) - egress_before
+        for c in [talker] + peers:
+            c.stop()
+    finally:
+        proc.terminate()
+        proc.wait()
+    cpu = _children_cpu() - cpu_before
+
+    return {
+        "mode": "multicast" if multicast else "unicast",
+        "min_delivered": min(p.delivered for p in peers),
+        "max_duplicates": max(p.stats.duplicates for p in peers),
+        "talker_frames": talker.delivered,
+        "talker_mcast": talker.mcast_enabled,
+        "egress_bytes": egress,
+        "cpu_s": cpu,
+    }
+
+
+def check_fallback(port: int, listeners: int, frames: int, interval: float) -> list[str]:
+    # 中继组播发送失效后，客户端应在 MCAST_TIMEOUT 后发 enabled=false，音频改回 TCP
+    server = VoiceRelayServer(LOOPBACK, port, multicast=True, multicast_if=LOOPBACK)
+    threading.Thread(target=server.start, daemon=True).start()
+    failures = []
+    try:
+        _wait_for_server(port)
+        talker, peers = _join_room(port, listeners, True)
+        server.mcast_sock.close()
+
+        timeout = MCAST_TIMEOUT + 2 * PING_INTERVAL
+        feeder = threading.Thread(target=_stream, args=(talker, int(timeout / interval), interval))
+        feeder.start()
+        fell_back = _wait_for(lambda: not any(p.mcast_enabled for p in peers), timeout)
+        feeder.join()
+        with server.rooms_lock:
+            relay_flags = [c.multicast for c in server.rooms.get("bench", set())]
+        if not fell_back or any(relay_flags):
+            failures.append("fallback: clients did not switch back to TCP after multicast stopped")
+
+        before = [p.delivered for p in peers]
+        _stream(talker, frames, interval)
+        time.sleep(0.5)
+        resumed = min(p.delivered - b for p, b in zip(peers, before))
+        if resumed < frames * 0.95:
+            failures.append(f"fallback: only {resumed}/{frames} frames delivered over TCP after fallback")
+        for c in [talker] + peers:
+            c.stop()
+    finally:
+        server.stop()
+    return failures
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compare relay egress and CPU: unicast fan-out vs multicast (loopback)")
+    parser.add_argument("--port", type=int, default=50100, help="Relay port used for the benchmark, default 50100")
+    parser.add_argument("--listeners", type=int, default=8, help="Listeners in the room, default 8")
+    parser.add_argument("--frames", type=int, default=1000, help="Audio frames sent by the talker, default 1000")
+    parser.add_argument("--interval-ms", type=float, default=2.0, help="Pacing between frames, default 2ms")
+    parser.add_argument("--min-delivery", type=float, default=0.95, help="Minimum delivery ratio per listener, default 0.95")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    interval = args.interval_ms / 1000
+    results = []
+    for multicast in (False, True):
+        results.append(run_mode(multicast, args.port, args.listeners, args.frames, interval))
+
+    print(f"{'mode':<10} {'egress_bytes':>14} {'cpu_s':>8} {'min_delivered':>14}")
+    for r in results:
+        print(f"{r['mode']:<10} {r['egress_bytes']:>14} {r['cpu_s']:>8.3f} {r['min_delivered']:>14}")
+
+    failures = []
+    for r in results:
+        if r["min_delivered"] < args.frames * args.min_delivery:
+            failures.append(f"{r['mode']}: listener received {r['min_delivered']}/{args.frames} frames")
+        if r["talker_frames"]:
+            failures.append(f"{r['mode']}: talker received {r['talker_frames']} of its own frames")
+        if r["max_duplicates"]:
+            failures.append(f"{r['mode']}: a listener saw {r['max_duplicates']} duplicate frames")
+    if not results[1]["talker_mcast"]:
+        failures.append("multicast: talker never received group traffic, self-filter path not exercised")
+    with contextlib.redirect_stdout(io.StringIO()):
+        failures += check_fallback(args.port + 1, min(args.listeners, 2), 200, 0.01)
+    for f in failures:
+        print(f"[FAIL] {f}")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# 这些模块会加载 numpy / PortAudio，开服或打开界面时都不应被导入
+HEAVY_MODULES = {"numpy", "sounddevice", "_sounddevice", "cffi"}
+
+ENTRY_POINTS = {
+    "server": 150.0,
+    "windows_app": 400.0,
+}
+
+
+def measure(module: str) -> tuple[float, set[str]]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr}")
+
+    total_us = 0
+    imported: set[str] = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        name = name.rstrip()
+        imported.add(name.strip().split(".")[0])
+        if name.strip() == module and not name.startswith("  "):
+            total_us = int(cumulative)
+    return total_us / 1000, imported
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Startup import-time regression guard (python -X importtime)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply the time budgets, e.g. 2 on slow machines")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per entry point, best is reported, default 3")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    failures = []
+    print(f"{'entry':<12} {'import_ms':>10} {'budget_ms':>10}")
+    for module, budget in ENTRY_POINTS.items():
+        results = [measure(module) for _ in range(args.runs)]
+        best = min(ms for ms, _ in results)
+        heavy = set().union(*(mods for _, mods in results)) & HEAVY_MODULES
+        limit = budget * args.scale
+        print(f"{module:<12} {best:>10.1f} {limit:>10.1f}")
+        if best > limit:
+            failures.append(f"{module}: import took {best:.1f}ms, budget {limit:.1f}ms")
+        if heavy:
+            failures.append(f"{module}: imports audio modules at startup: {', '.join(sorted(heavy))}")
+    for f in failures:
+        print(f"[FAIL] {f}")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -31,9 +31,13 @@ Invoke-Checked -Command "uv pip install --python `"$VenvPython`" -r requirements
 
 Invoke-Checked -Command "uv run --python `"$VenvPython`" pyinstaller --noconfirm --onefile --windowed --name LanVoiceChatWindows windows_app.py" -Description "执行 Windows 打包"
 
-$outputExe = Join-Path $ProjectRoot "dist\LanVoiceChatWindows.exe"
-if (-not (Test-Path $outputExe)) {
-	throw "打包流程结束但未找到输出文件: $outputExe"
-}
+# 纯服务端不依赖音频库，排除 numpy / sounddevice 以缩小单文件体积、加快冷启动
+Invoke-Checked -Command "uv run --python `"$VenvPython`" pyinstaller --noconfirm --onefile --console --name LanVoiceRelay --exclude-module numpy --exclude-module sounddevice --exclude-module _sounddevice server.py" -Description "打包纯服务端"
 
-Write-Host "打包完成，输出文件: $outputExe"
+foreach ($name in @("LanVoiceChatWindows", "LanVoiceRelay")) {
+	$outputExe = Join-Path $ProjectRoot "dist\$name.exe"
+	if (-not (Test-Path $outputExe)) {
+		throw "打包流程结束但未找到输出文件: $outputExe"
+	}
+	Write-Host "打包完成，输出文件: $outputExe"
+}
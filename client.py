@@ -3,12 +3,30 @@ import queue
 import socket
 import threading
 import time
-from typing import Callable, Optional
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Tuple
 
 import numpy as np
-import sounddevice as sd
 
-from common import MSG_AUDIO, MSG_JOIN, MSG_LEAVE, MSG_SYS, pack_json, recv_packet, send_packet, unpack_json
+from common import (
+    MSG_AUDIO,
+    MSG_JOIN,
+    MSG_LEAVE,
+    MSG_MCAST,
+    MSG_PING,
+    MSG_PONG,
+    MSG_SYS,
+    MCAST_TIMEOUT,
+    PING_INTERVAL,
+    open_mcast_receiver,
+    pack_json,
+    pack_seq_audio,
+    recv_packet,
+    send_packet,
+    unpack_json,
+    unpack_mcast_audio,
+    unpack_relay_audio,
+)
 
 SAMPLE_RATE = 16000
 CHANNELS = 1
@@ -19,6 +37,39 @@ FRAME_BYTES = BLOCK_SIZE * 2
 MIC_QUEUE_MAX = 8
 PLAY_QUEUE_MAX = 10
 MAX_JITTER_FRAMES = 2
+JITTER_RESET_MS = 1000
+
+if TYPE_CHECKING:
+    # sounddevice 导入时即加载 PortAudio，推迟到打开音频流时导入，无声卡环境也能只跑网络部分
+    import sounddevice as sd
+
+
+@dataclass
+class ClientStats:
+    rtt_ms: Optional[float] = None
+    jitter_ms: float = 0.0
+    mic_queue: int = 0
+    play_queue: int = 0
+    mic_dropped: int = 0
+    play_dropped: int = 0
+    play_trimmed: int = 0
+    duplicates: int = 0
+    underruns: int = 0
+    device_underruns: int = 0
+    input_latency_ms: Optional[float] = None
+    output_latency_ms: Optional[float] = None
+
+    def format(self) -> str:
+        rtt = f"{self.rtt_ms:.1f} ms" if self.rtt_ms is not None else "-"
+        in_lat = f"{self.input_latency_ms:.1f} ms" if self.input_latency_ms is not None else "-"
+        out_lat = f"{self.output_latency_ms:.1f} ms" if self.output_latency_ms is not None else "-"
+        return (
+            f"网络 RTT: {rtt}    抖动: {self.jitter_ms:.1f} ms\n"
+            f"队列深度: 采集 {self.mic_queue}/{MIC_QUEUE_MAX}  播放 {self.play_queue}/{PLAY_QUEUE_MAX}\n"
+            f"丢帧: 采集 {self.mic_dropped}  播放 {self.play_dropped}  缓冲裁剪 {self.play_trimmed}  重复 {self.duplicates}\n"
+            f"播放欠载: 断流 {self.underruns}  设备 {self.device_underruns}\n"
+            f"设备延迟: 输入 {in_lat}  输出 {out_lat}"
+        )
 
 
 class VoiceClient:
@@ -29,18 +80,21 @@ class VoiceClient:
         room: str,
         name: str,
         on_system_message: Optional[Callable[[str], None]] = None,
+        multicast: bool = False,
     ):
         self.host = host
         self.port = port
         self.room = room
         self.name = name
         self.on_system_message = on_system_message
+        self.multicast = multicast
 
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self.running = threading.Event()
         self.running.clear()
         self.connected = False
+        self.send_lock = threading.Lock()
 
         self.capture_enabled = True
         self.capture_lock = threading.Lock()
@@ -49,6 +103,16 @@ class VoiceClient:
         self.play_queue: queue.Queue[bytes] = queue.Queue(maxsize=PLAY_QUEUE_MAX)
         self.sender_thread: Optional[threading.Thread] = None
         self.receiver_thread: Optional[threading.Thread] = None
+        self.mcast_thread: Optional[threading.Thread] = None
+        self.mcast_sock: Optional[socket.socket] = None
+        self.mcast_id = 0
+        self.mcast_token = 0
+        self.mcast_enabled = False
+        self.stats = ClientStats()
+        self._last_ping = 0.0
+        self._capture_seq = 0
+        self._last_audio: Dict[int, Tuple[float, int]] = {}
+        self._playing = False
         self.input_stream: Optional[sd.InputStream] = None
         self.output_stream: Optional[sd.OutputStream] = None
 
@@ -58,11 +122,15 @@ class VoiceClient:
         else:
             print(f"[系统] {text}")
 
+    def _send(self, msg_type: int, payload: bytes = b"") -> None:
+        with self.send_lock:
+            send_packet(self.sock, msg_type, payload)
+
     @staticmethod
-    def _put_latest_frame(target_queue: queue.Queue[bytes], frame: bytes) -> None:
+    def _put_latest_frame(target_queue: queue.Queue[bytes], frame: bytes) -> bool:
         try:
             target_queue.put_nowait(frame)
-            return
+            return False
         except queue.Full:
             pass
 
@@ -75,6 +143,37 @@ class VoiceClient:
             target_queue.put_nowait(frame)
         except queue.Full:
             pass
+        return True
+
+    def _on_audio_frame(self, frame: bytes, sender_id: int, seq: int) -> None:
+        # 按发送者做 RFC 3550 传输时延抖动估计：到达间隔与采集序号间隔之差。
+        # 闭麦期间序号照常递增，所以网络或中继卡顿都会计入，而静音不会。
+        # 发送端未提供序号（seq 为 0，如 Android）时退化为到达间隔，间隔过长视为静音只重置基准。
+        now = time.monotonic()
+        last = self._last_audio.get(sender_id)
+        if last is not None and seq and last[1] and seq <= last[1]:
+            # 切换组播期间同一帧可能经 TCP 与组播各到一次，按序号去重
+            self.stats.duplicates += 1
+            return
+        self._last_audio[sender_id] = (now, seq)
+        if last is not None:
+            last_at, last_seq = last
+            gap_ms = (now - last_at) * 1000
+            if seq and last_seq:
+                deviation = abs(gap_ms - (seq - last_seq) * FRAME_MS)
+            elif gap_ms <= JITTER_RESET_MS:
+                deviation = abs(gap_ms - FRAME_MS)
+            else:
+                deviation = None
+            if deviation is not None:
+                self.stats.jitter_ms += (deviation - self.stats.jitter_ms) / 16
+        if self._put_latest_frame(self.play_queue, frame):
+            self.stats.play_dropped += 1
+
+    def get_stats(self) -> ClientStats:
+        self.stats.mic_queue = self.mic_queue.qsize()
+        self.stats.play_queue = self.play_queue.qsize()
+        return self.stats
 
     def connect(self) -> None:
         target_host = self.host
@@ -89,17 +188,25 @@ class VoiceClient:
                 f"连接失败: {target_host}:{self.port}。请确认服务端已启动，且端口/IP 正确。"
             ) from exc
 
-        send_packet(self.sock, MSG_JOIN, pack_json({"room": self.room, "name": self.name}))
+        self._send(MSG_JOIN, pack_json({"room": self.room, "name": self.name, "seq": True}))
         self.connected = True
 
     def _send_loop(self) -> None:
         while self.running.is_set():
+            now = time.monotonic()
+            if now - self._last_ping >= PING_INTERVAL:
+                self._last_ping = now
+                try:
+                    self._send(MSG_PING, pack_json({"t": now}))
+                except OSError:
+                    self.running.clear()
+                    break
             try:
                 frame = self.mic_queue.get(timeout=0.2)
             except queue.Empty:
                 continue
             try:
-                send_packet(self.sock, MSG_AUDIO, frame)
+                self._send(MSG_AUDIO, frame)
             except OSError:
                 self.running.clear()
                 break
@@ -116,18 +223,95 @@ class VoiceClient:
                 break
             msg_type, payload = packet
             if msg_type == MSG_AUDIO:
-                if len(payload) == FRAME_BYTES:
-                    self._put_latest_frame(self.play_queue, payload)
+                audio = unpack_relay_audio(payload)
+                if audio is not None and len(audio[2]) == FRAME_BYTES:
+                    self._on_audio_frame(audio[2], audio[0], audio[1])
+            elif msg_type == MSG_PING:
+                try:
+                    self._send(MSG_PONG, payload)
+                except OSError:
+                    self.running.clear()
+                    break
+            elif msg_type == MSG_PONG:
+                try:
+                    self.stats.rtt_ms = (time.monotonic() - float(unpack_json(payload)["t"])) * 1000
+                except (KeyError, TypeError, ValueError):
+                    pass
             elif msg_type == MSG_SYS:
                 try:
-                    text = unpack_json(payload).get("text", "")
+                    info = unpack_json(payload)
+                    text = info.get("text", "")
                 except Exception:
+                    info = {}
                     text = payload.decode("utf-8", errors="ignore")
                 self._emit_system(text)
+                if self.multicast and "multicast" in info:
+                    self._start_multicast(info["multicast"])
+
+    def _start_multicast(self, info: dict) -> None:
+        if self.mcast_sock is not None:
+            return
+        try:
+            group = str(info["group"])
+            port = int(info["port"])
+            self.mcast_id = int(info["id"])
+            self.mcast_token = int(info["token"])
+            # 用连接服务端所走的网卡加入组播组
+            interface = self.sock.getsockname()[0]
+            self.mcast_sock = open_mcast_receiver(group, port, interface)
+            self.mcast_sock.settimeout(0.2)
+        except (KeyError, TypeError, ValueError, OSError) as exc:
+            self._emit_system(f"组播不可用，继续使用 TCP: {exc}")
+            return
+
+        # 加入组播组成功不代表能收到，收到服务端探测包后才通知服务端停发 TCP
+        self.mcast_thread = threading.Thread(target=self._mcast_loop, args=(f"{group}:{port}",), daemon=True)
+        self.mcast_thread.start()
+
+    def _set_mcast_enabled(self, enabled: bool) -> bool:
+        try:
+            self._send(MSG_MCAST, pack_json({"enabled": enabled}))
+        except OSError:
+            self.running.clear()
+            return False
+        self.mcast_enabled = enabled
+        return True
+
+    def _mcast_loop(self, label: str) -> None:
+        sock = self.mcast_sock
+        last_recv = 0.0
+        while self.running.is_set() and sock is not None:
+            try:
+                data, _ = sock.recvfrom(4096)
+            except socket.timeout:
+                data = b""
+            except OSError:
+                break
+            now = time.monotonic()
+            packet = unpack_mcast_audio(data)
+            if packet is None or packet[0] != self.mcast_token:
+                if self.mcast_enabled and now - last_recv > MCAST_TIMEOUT:
+                    if not self._set_mcast_enabled(False):
+                        break
+                    self._emit_system(f"组播 {label} 中断，已回退 TCP")
+                continue
+
+            last_recv = now
+            if not self.mcast_enabled:
+                if not self._set_mcast_enabled(True):
+                    break
+                self._emit_system(f"已启用组播接收 {label}")
+            _, sender_id, seq, frame = packet
+            if sender_id == self.mcast_id:
+                continue
+            if len(frame) == FRAME_BYTES:
+                self._on_audio_frame(frame, sender_id, seq)
 
     def _input_callback(self, indata, frames, time_info, status) -> None:
         if not self.running.is_set():
             return
+        # 每个采集周期都递增序号（含闭麦与异常帧），接收端据此区分静音与卡顿
+        self._capture_seq += 1
         if status:
             return
         with self.capture_lock:
@@ -136,18 +320,22 @@ class VoiceClient:
         frame = np.asarray(indata, dtype=np.int16).reshape(-1).tobytes()
         if len(frame) != FRAME_BYTES:
             return
-        self._put_latest_frame(self.mic_queue, frame)
+        if self._put_latest_frame(self.mic_queue, pack_seq_audio(self._capture_seq, frame)):
+            self.stats.mic_dropped += 1
 
     def _output_callback(self, outdata, frames, time_info, status) -> None:
         if not self.running.is_set():
             outdata[:] = np.zeros((frames, CHANNELS), dtype=np.int16)
             return
+        if status.output_underflow:
+            self.stats.device_underruns += 1
 
         while self.play_queue.qsize() > MAX_JITTER_FRAMES + 1:
             try:
                 self.play_queue.get_nowait()
             except queue.Empty:
                 break
+            self.stats.play_trimmed += 1
 
         try:
             frame = self.play_queue.get_nowait()
@@ -156,12 +344,17 @@ class VoiceClient:
                 outdata[:] = arr
             else:
                 outdata[:] = np.zeros((frames, CHANNELS), dtype=np.int16)
+            self._playing = True
         except queue.Empty:
             outdata[:] = np.zeros((frames, CHANNELS), dtype=np.int16)
+            # 只统计播放中途断流，无人说话时的空队列不算欠载
+            if self._playing:
+                self.stats.underruns += 1
+            self._playing = False
 
     def run(self) -> None:
         self.start()
-        self._emit_system("已连接（低延迟模式）。命令：/mute 静音麦克风，/unmute 取消静音，/quit 退出")
+        self._emit_system("已连接（低延迟模式）。命令：/mute 静音麦克风，/unmute 取消静音，/stats 延迟统计，/quit 退出")
 
         try:
             while self.running.is_set():
@@ -174,15 +367,14 @@ class VoiceClient:
                 elif cmd == "/unmute":
                     self.set_mute(False)
                     print("麦克风已开启")
+                elif cmd == "/stats":
+                    print(self.get_stats().format())
         except (KeyboardInterrupt, EOFError):
             pass
         finally:
             self.stop()
 
-    def start(self) -> None:
-        if self.running.is_set():
-            return
-
+    def _start_network(self) -> None:
         self.connect()
         self.running.set()
 
@@ -191,6 +383,13 @@ class VoiceClient:
         self.sender_thread.start()
         self.receiver_thread.start()
 
+    def start(self) -> None:
+        if self.running.is_set():
+            return
+
+        import sounddevice as sd
+
+        self._start_network()
         self.input_stream = sd.InputStream(
             samplerate=SAMPLE_RATE,
             channels=CHANNELS,
@@ -209,13 +408,15 @@ class VoiceClient:
         )
         self.input_stream.start()
         self.output_stream.start()
+        self.stats.input_latency_ms = self.input_stream.latency * 1000
+        self.stats.output_latency_ms = self.output_stream.latency * 1000
 
     def stop(self) -> None:
         self.running.clear()
 
         try:
             if self.connected:
-                send_packet(self.sock, MSG_LEAVE)
+                self._send(MSG_LEAVE)
         except OSError:
             pass
 
@@ -238,6 +439,12 @@ class VoiceClient:
             self.sock.close()
         except OSError:
             pass
+        if self.mcast_sock is not None:
+            try:
+                self.mcast_sock.close()
+            except OSError:
+                pass
+            self.mcast_sock = None
 
         self.connected = False
 
@@ -251,13 +458,14 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--port", type=int, default=50000, help="Server port, default 50000")
     parser.add_argument("--room", required=True, help="Room name")
     parser.add_argument("--name", default="", help="Display name")
+    parser.add_argument("--multicast", action="store_true", help="Receive room audio via IP multicast when the server offers it")
     return parser.parse_args()
 
 
 def main() -> None:
     args = parse_args()
     name = args.name.strip() or socket.gethostname()
-    client = VoiceClient(args.host, args.port, args.room, name)
+    client = VoiceClient(args.host, args.port, args.room, name, multicast=args.multicast)
     try:
         client.run()
     except RuntimeError as exc:
@@ -1,14 +1,28 @@
 import json
 import socket
 import struct
+import sys
 from typing import Optional, Tuple
 
 MSG_JOIN = 1
 MSG_AUDIO = 2
 MSG_LEAVE = 3
 MSG_SYS = 4
+MSG_MCAST = 5
+MSG_PING = 6
+MSG_PONG = 7
+
+PING_INTERVAL = 1.0
+
+MCAST_GROUP_PREFIX = "239.255"
+MCAST_PORT_OFFSET = 1000
+MCAST_TTL = 1
+MCAST_TIMEOUT = 3 * PING_INTERVAL
 
 _HEADER_STRUCT = struct.Struct("!BI")
+_SEQ_STRUCT = struct.Struct("!I")
+_RELAY_AUDIO_STRUCT = struct.Struct("!II")
+_MCAST_HEADER_STRUCT = struct.Struct("!III")
 
 
 def send_packet(sock: socket.socket, msg_type: int, payload: bytes = b"") -> None:
@@ -43,3 +57,62 @@ def pack_json(obj: dict) -> bytes:
 
 def unpack_json(data: bytes) -> dict:
     return json.loads(data.decode("utf-8"))
+
+
+# 序号为发送端采集帧序号（从 1 开始，闭麦时照常递增），0 表示发送端未提供序号
+
+
+def pack_seq_audio(seq: int, payload: bytes) -> bytes:
+    return _SEQ_STRUCT.pack(seq) + payload
+
+
+def unpack_seq_audio(data: bytes) -> Optional[Tuple[int, bytes]]:
+    if len(data) < _SEQ_STRUCT.size:
+        return None
+    (seq,) = _SEQ_STRUCT.unpack_from(data)
+    return seq, data[_SEQ_STRUCT.size:]
+
+
+def pack_relay_audio(sender_id: int, seq: int, payload: bytes) -> bytes:
+    return _RELAY_AUDIO_STRUCT.pack(sender_id, seq) + payload
+
+
+def unpack_relay_audio(data: bytes) -> Optional[Tuple[int, int, bytes]]:
+    if len(data) < _RELAY_AUDIO_STRUCT.size:
+        return None
+    sender_id, seq = _RELAY_AUDIO_STRUCT.unpack_from(data)
+    return sender_id, seq, data[_RELAY_AUDIO_STRUCT.size:]
+
+
+def pack_mcast_audio(token: int, sender_id: int, seq: int, payload: bytes) -> bytes:
+    return _MCAST_HEADER_STRUCT.pack(token, sender_id, seq) + payload
+
+
+def unpack_mcast_audio(data: bytes) -> Optional[Tuple[int, int, int, bytes]]:
+    if len(data) < _MCAST_HEADER_STRUCT.size:
+        return None
+    token, sender_id, seq = _MCAST_HEADER_STRUCT.unpack_from(data)
+    return token, sender_id, seq, data[_MCAST_HEADER_STRUCT.size:]
+
+
+def open_mcast_sender(interface: str = "") -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, MCAST_TTL)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+    if interface:
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(interface))
+    return sock
+
+
+def open_mcast_receiver(group: str, port: int, interface: str = "") -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Windows 不允许绑定组播地址，其它平台绑定组地址可避免收到同端口的其它组
+        sock.bind(("" if sys.platform == "win32" else group, port))
+        membership = struct.pack("4s4s", socket.inet_aton(group), socket.inet_aton(interface or "0.0.0.0"))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+    except OSError:
+        sock.close()
+        raise
+    return sock
@@ -1,10 +1,51 @@
 import argparse
+import ipaddress
+import itertools
+import random
 import socket
 import threading
-from dataclasses import dataclass
-from typing import Dict, Set
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Set, Tuple
 
-from common import MSG_AUDIO, MSG_JOIN, MSG_LEAVE, MSG_SYS, pack_json, recv_packet, send_packet, unpack_json
+from common import (
+    MCAST_GROUP_PREFIX,
+    MCAST_PORT_OFFSET,
+    MSG_AUDIO,
+    MSG_JOIN,
+    MSG_LEAVE,
+    MSG_MCAST,
+    MSG_PING,
+    MSG_PONG,
+    MSG_SYS,
+    PING_INTERVAL,
+    open_mcast_sender,
+    pack_json,
+    pack_mcast_audio,
+    pack_relay_audio,
+    recv_packet,
+    send_packet,
+    unpack_json,
+    unpack_seq_audio,
+)
+
+MAX_MCAST_ROOMS = 254
+
+
+def _check_multicast_group(value: str) -> str:
+    try:
+        addr = ipaddress.IPv4Address(value)
+    except ValueError as exc:
+        raise ValueError(f"invalid multicast group {value!r}: not an IPv4 address") from exc
+    if not addr.is_multicast:
+        raise ValueError(f"invalid multicast group {value!r}: not in 224.0.0.0/4")
+    return str(addr)
+
+
+def _check_multicast_port(value: int) -> int:
+    if not 0 < value or value + MAX_MCAST_ROOMS > 65535:
+        raise ValueError(f"invalid multicast port base {value}: must be 1-{65535 - MAX_MCAST_ROOMS}")
+    return value
 
 
 @dataclass(eq=False)
@@ -13,16 +54,56 @@ class ClientConn:
     addr: tuple
     name: str = ""
     room: str = ""
+    client_id: int = 0
+    multicast: bool = False
+    seq_audio: bool = False
+    rtt_ms: float | None = None
+    send_lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def send(self, msg_type: int, payload: bytes = b"") -> None:
+        # 转发线程、心跳线程与本连接线程会并发写同一个 socket
+        with self.send_lock:
+            send_packet(self.sock, msg_type, payload)
 
 
 class VoiceRelayServer:
-    def __init__(self, host: str, port: int):
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        multicast: bool = False,
+        multicast_if: str = "",
+        multicast_group: str = "",
+        multicast_port: int = 0,
+    ):
         self.host = host
         self.port = port
+        self.multicast = multicast
+        self.multicast_if = multicast_if
+        # 默认按中继端口推导组播地址段与端口段，同一局域网（或同机）多个中继互不串音；
+        # 显式指定的值只校验不改写
+        if multicast_group:
+            multicast_group = _check_multicast_group(multicast_group)
+        else:
+            multicast_group = f"{MCAST_GROUP_PREFIX}.{port % 256}.0"
+        self.multicast_prefix = multicast_group.rsplit(".", 1)[0]
+        if multicast_port:
+            self.multicast_port = _check_multicast_port(multicast_port)
+        else:
+            self.multicast_port = port + MCAST_PORT_OFFSET
+            if self.multicast_port + MAX_MCAST_ROOMS > 65535:
+                self.multicast_port = port - MCAST_PORT_OFFSET - MAX_MCAST_ROOMS
+        # 组播包携带会话令牌，客户端据此丢弃其它中继的包
+        self.mcast_token = random.getrandbits(32)
         self.server_sock: socket.socket | None = None
+        self.mcast_sock: socket.socket | None = None
         self.rooms: Dict[str, Set[ClientConn]] = {}
+        self.room_groups: Dict[str, Tuple[str, int]] = {}
         self.rooms_lock = threading.Lock()
         self.running = threading.Event()
+        self.ping_thread: threading.Thread | None = None
+        self._ping_stop = threading.Event()
+        self._client_ids = itertools.count(1)
 
     def start(self) -> None:
         self.running.set()
@@ -32,6 +113,16 @@ class VoiceRelayServer:
         self.server_sock.listen(100)
         self.server_sock.settimeout(1.0)
         print(f"[SERVER] listening on {self.host}:{self.port}")
+        if self.multicast:
+            self.mcast_sock = open_mcast_sender(self.multicast_if)
+            print(
+                f"[SERVER] multicast enabled, groups {self.multicast_prefix}.1-{MAX_MCAST_ROOMS} "
+                f"ports {self.multicast_port + 1}-{self.multicast_port + MAX_MCAST_ROOMS}"
+            )
+        # 每次启动使用独立的停止事件，避免 stop 后迅速重启时旧心跳线程继续运行
+        self._ping_stop = threading.Event()
+        self.ping_thread = threading.Thread(target=self._ping_loop, args=(self._ping_stop,), daemon=True)
+        self.ping_thread.start()
 
         while self.running.is_set():
             try:
@@ -47,6 +138,11 @@ class VoiceRelayServer:
 
     def stop(self) -> None:
         self.running.clear()
+        self._ping_stop.set()
+        ping_thread = self.ping_thread
+        if ping_thread is not None and ping_thread is not threading.current_thread():
+            ping_thread.join(timeout=PING_INTERVAL)
+            self.ping_thread = None
         sock = self.server_sock
         if sock is not None:
             try:
@@ -54,6 +150,50 @@ class VoiceRelayServer:
             except OSError:
                 pass
             self.server_sock = None
+        mcast_sock = self.mcast_sock
+        if mcast_sock is not None:
+            try:
+                mcast_sock.close()
+            except OSError:
+                pass
+            self.mcast_sock = None
+
+    def _ping_loop(self, stop_event: threading.Event) -> None:
+        while not stop_event.wait(PING_INTERVAL):
+            with self.rooms_lock:
+                clients = [c for members in self.rooms.values() for c in members]
+                groups = list(self.room_groups.values())
+            payload = pack_json({"t": time.monotonic()})
+            for c in clients:
+                try:
+                    c.send(MSG_PING, payload)
+                except OSError:
+                    pass
+            for group in groups:
+                self._send_probe(group)
+
+    def _send_probe(self, group: Tuple[str, int]) -> None:
+        # 空负载探测包：客户端收到后才确认组播可用，中断后据此回退 TCP
+        mcast_sock = self.mcast_sock
+        if mcast_sock is None:
+            return
+        try:
+            mcast_sock.sendto(pack_mcast_audio(self.mcast_token, 0, 0, b""), group)
+        except OSError:
+            pass
+
+    def _assign_group(self, room: str) -> Tuple[str, int] | None:
+        # 调用方需持有 rooms_lock
+        group = self.room_groups.get(room)
+        if group is not None:
+            return group
+        used = {port - self.multicast_port for _, port in self.room_groups.values()}
+        for index in range(1, MAX_MCAST_ROOMS + 1):
+            if index not in used:
+                group = (f"{self.multicast_prefix}.{index}", self.multicast_port + index)
+                self.room_groups[room] = group
+                return group
+        return None
 
     def _broadcast_sys(self, room: str, text: str, exclude: ClientConn | None = None) -> None:
         payload = pack_json({"text": text})
@@ -63,7 +203,7 @@ class VoiceRelayServer:
             if exclude is not None and c is exclude:
                 continue
             try:
-                send_packet(c.sock, MSG_SYS, payload)
+                c.send(MSG_SYS, payload)
             except OSError:
                 pass
 
@@ -75,17 +215,31 @@ class VoiceRelayServer:
                 removed = True
                 if not self.rooms[client.room]:
                     del self.rooms[client.room]
+                    self.room_groups.pop(client.room, None)
         if removed:
             self._broadcast_sys(client.room, f"{client.name} 离开房间")
 
-    def _forward_audio(self, sender: ClientConn, audio_payload: bytes) -> None:
+    def _forward_audio(self, sender: ClientConn, seq: int, audio_payload: bytes) -> None:
         with self.rooms_lock:
             peers = list(self.rooms.get(sender.room, set()))
+            group = self.room_groups.get(sender.room)
+        # 声明 seq 的客户端收到带发送者与序号的帧，其它客户端（如 Android）仍收裸 PCM
+        relay_payload = pack_relay_audio(sender.client_id, seq, audio_payload)
+        mcast_needed = False
         for peer in peers:
             if peer is sender:
                 continue
+            if peer.multicast and group is not None:
+                mcast_needed = True
+                continue
             try:
-                send_packet(peer.sock, MSG_AUDIO, audio_payload)
+                peer.send(MSG_AUDIO, relay_payload if peer.seq_audio else audio_payload)
+            except OSError:
+                pass
+        mcast_sock = self.mcast_sock
+        if mcast_needed and mcast_sock is not None:
+            try:
+                mcast_sock.sendto(pack_mcast_audio(self.mcast_token, sender.client_id, seq, audio_payload), group)
             except OSError:
                 pass
 
@@ -113,11 +267,26 @@ class VoiceRelayServer:
 
             client.room = room
             client.name = name
+            client.client_id = next(self._client_ids)
+            client.seq_audio = bool(info.get("seq", False))
 
+            group = None
             with self.rooms_lock:
                 self.rooms.setdefault(room, set()).add(client)
+                if self.mcast_sock is not None:
+                    group = self._assign_group(room)
 
-            send_packet(client_sock, MSG_SYS, pack_json({"text": f"已加入房间 {room}"}))
+            join_ack = {"text": f"已加入房间 {room}"}
+            if group is not None:
+                join_ack["multicast"] = {
+                    "group": group[0],
+                    "port": group[1],
+                    "id": client.client_id,
+                    "token": self.mcast_token,
+                }
+            client.send(MSG_SYS, pack_json(join_ack))
+            if group is not None:
+                self._send_probe(group)
             self._broadcast_sys(room, f"{name} 加入房间", exclude=client)
             print(f"[JOIN] {name} @ {addr} room={room}")
 
@@ -127,7 +296,24 @@ class VoiceRelayServer:
                     break
                 t, p = packet
                 if t == MSG_AUDIO:
-                    self._forward_audio(client, p)
+                    if client.seq_audio:
+                        audio = unpack_seq_audio(p)
+                        if audio is not None:
+                            self._forward_audio(client, *audio)
+                    else:
+                        self._forward_audio(client, 0, p)
+                elif t == MSG_PING:
+                    client.send(MSG_PONG, p)
+                elif t == MSG_PONG:
+                    try:
+                        client.rtt_ms = (time.monotonic() - float(unpack_json(p)["t"])) * 1000
+                    except (KeyError, TypeError, ValueError):
+                        pass
+                elif t == MSG_MCAST:
+                    try:
+                        client.multicast = bool(unpack_json(p).get("enabled", False))
+                    except ValueError:
+                        client.multicast = False
                 elif t == MSG_LEAVE:
                     break
 
@@ -140,19 +326,55 @@ class VoiceRelayServer:
             except OSError:
                 pass
             if client.name:
-                print(f"[LEAVE] {client.name} @ {addr}")
+                rtt = f" rtt={client.rtt_ms:.1f}ms" if client.rtt_ms is not None else ""
+                print(f"[LEAVE] {client.name} @ {addr}{rtt}")
+
+
+def _multicast_group_arg(value: str) -> str:
+    try:
+        return _check_multicast_group(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc)) from exc
+
+
+def _multicast_port_arg(value: str) -> int:
+    try:
+        return _check_multicast_port(int(value))
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc)) from exc
 
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="LAN Voice Relay Server")
     parser.add_argument("--host", default="0.0.0.0", help="Bind host, default 0.0.0.0")
     parser.add_argument("--port", type=int, default=50000, help="Bind port, default 50000")
+    parser.add_argument("--multicast", action="store_true", help="Deliver room audio via IP multicast to capable clients")
+    parser.add_argument("--multicast-if", default="", help="Local interface IP for multicast egress, default OS route")
+    parser.add_argument(
+        "--multicast-group",
+        default=None,
+        type=_multicast_group_arg,
+        help="Multicast group base, e.g. 239.255.80.0, default derived from --port"
+    )
+    parser.add_argument(
+        "--multicast-port",
+        default=0,
+        type=_multicast_port_arg,
+        help="Multicast port base, room N uses base+N, default --port + 1000"
+    )
     return parser.parse_args()
 
 
 def main() -> None:
     args = parse_args()
-    server = VoiceRelayServer(args.host, args.port)
+    server = VoiceRelayServer(
+        args.host,
+        args.port,
+        multicast=args.multicast,
+        multicast_if=args.multicast_if,
+        multicast_group=args.multicast_group or "",
+        multicast_port=args.multicast_port,
+    )
     server.start()
 
 
@@ -2,16 +2,22 @@ import socket
 import threading
 import tkinter as tk
 from tkinter import ttk, messagebox
+from typing import TYPE_CHECKING
 
-from client import VoiceClient
 from server import VoiceRelayServer
 
+if TYPE_CHECKING:
+    # client 会拉起 numpy 与 sounddevice（初始化 PortAudio），仅在真正连接时导入
+    from client import VoiceClient
+
+STATS_REFRESH_MS = 1000
+
 
 class WindowsVoiceApp:
     def __init__(self, root: tk.Tk):
         self.root = root
         self.root.title("LAN Voice Chat - All In One")
-        self.root.geometry("620x600")
+        self.root.geometry("620x700")
 
         self.client: VoiceClient | None = None
         self.connected = False
@@ -19,6 +25,7 @@ class WindowsVoiceApp:
         self.server: VoiceRelayServer | None = None
         self.server_thread: threading.Thread | None = None
         self.server_running = False
+        self.stats_job: str | None = None
 
         self.server_host_var = tk.StringVar(value="0.0.0.0")
         self.server_port_var = tk.StringVar(value="50000")
@@ -26,6 +33,9 @@ class WindowsVoiceApp:
         self.port_var = tk.StringVar(value="50000")
         self.room_var = tk.StringVar(value="room1")
         self.name_var = tk.StringVar(value=socket.gethostname())
+        self.server_multicast_var = tk.BooleanVar(value=False)
+        self.multicast_var = tk.BooleanVar(value=False)
+        self.stats_var = tk.StringVar(value="未连接")
 
         self._build_ui()
         self._set_state(False)
@@ -41,9 +51,12 @@ class WindowsVoiceApp:
         ttk.Entry(server_frame, textvariable=self.server_host_var, width=24).grid(row=0, column=1, sticky=tk.W, pady=4)
         ttk.Label(server_frame, text="端口").grid(row=0, column=2, sticky=tk.W, padx=(12, 0), pady=4)
         ttk.Entry(server_frame, textvariable=self.server_port_var, width=12).grid(row=0, column=3, sticky=tk.W, pady=4)
+        ttk.Checkbutton(server_frame, text="组播分发", variable=self.server_multicast_var).grid(
+            row=0, column=4, sticky=tk.W, padx=(12, 0), pady=4
+        )
 
         server_btn_bar = ttk.Frame(server_frame)
-        server_btn_bar.grid(row=1, column=0, columnspan=4, sticky=tk.W, pady=(6, 0))
+        server_btn_bar.grid(row=1, column=0, columnspan=5, sticky=tk.W, pady=(6, 0))
         self.start_server_btn = ttk.Button(server_btn_bar, text="启动服务端", command=self.start_server)
         self.start_server_btn.pack(side=tk.LEFT)
         self.stop_server_btn = ttk.Button(server_btn_bar, text="停止服务端", command=self.stop_server)
@@ -66,8 +79,12 @@ class WindowsVoiceApp:
         ttk.Label(client_frame, text="昵称").grid(row=3, column=0, sticky=tk.W, pady=4)
         ttk.Entry(client_frame, textvariable=self.name_var, width=36).grid(row=3, column=1, sticky=tk.EW, pady=4)
 
+        ttk.Checkbutton(client_frame, text="组播接收（服务端开启组播时生效）", variable=self.multicast_var).grid(
+            row=4, column=1, sticky=tk.W, pady=4
+        )
+
         btn_bar = ttk.Frame(client_frame)
-        btn_bar.grid(row=4, column=0, columnspan=2, sticky=tk.W, pady=10)
+        btn_bar.grid(row=5, column=0, columnspan=2, sticky=tk.W, pady=10)
 
         self.connect_btn = ttk.Button(btn_bar, text="连接", command=self.connect)
         self.connect_btn.pack(side=tk.LEFT)
@@ -80,12 +97,16 @@ class WindowsVoiceApp:
 
         client_frame.columnconfigure(1, weight=1)
 
-        ttk.Label(frm, text="日志").grid(row=2, column=0, sticky=tk.W, pady=(12, 4))
+        stats_frame = ttk.LabelFrame(frm, text="延迟统计", padding=10)
+        stats_frame.grid(row=2, column=0, columnspan=2, sticky=tk.EW, pady=(12, 0))
+        ttk.Label(stats_frame, textvariable=self.stats_var, justify=tk.LEFT).grid(row=0, column=0, sticky=tk.W)
+
+        ttk.Label(frm, text="日志").grid(row=3, column=0, sticky=tk.W, pady=(12, 4))
         self.log_text = tk.Text(frm, height=16, wrap=tk.WORD)
-        self.log_text.grid(row=3, column=0, columnspan=2, sticky=tk.NSEW)
+        self.log_text.grid(row=4, column=0, columnspan=2, sticky=tk.NSEW)
 
         frm.columnconfigure(1, weight=1)
-        frm.rowconfigure(3, weight=1)
+        frm.rowconfigure(4, weight=1)
 
         self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
@@ -102,12 +123,25 @@ class WindowsVoiceApp:
             self.connect_btn.config(state=tk.DISABLED)
             self.disconnect_btn.config(state=tk.NORMAL)
             self.mute_btn.config(state=tk.NORMAL)
+            if self.stats_job is None:
+                self._refresh_stats()
         else:
             self.connect_btn.config(state=tk.NORMAL)
             self.disconnect_btn.config(state=tk.DISABLED)
             self.mute_btn.config(state=tk.DISABLED)
             self.muted = False
             self.mute_btn.config(text="静音麦克风")
+            if self.stats_job is not None:
+                self.root.after_cancel(self.stats_job)
+                self.stats_job = None
+            self.stats_var.set("未连接")
+
+    def _refresh_stats(self) -> None:
+        # 统计由音频线程持续更新，界面按固定间隔拉取，避免逐帧唤醒 Tk 线程
+        client = self.client
+        if client is not None:
+            self.stats_var.set(client.get_stats().format())
+        self.stats_job = self.root.after(STATS_REFRESH_MS, self._refresh_stats)
 
     def _set_server_state(self, running: bool) -> None:
         self.server_running = running
@@ -131,7 +165,8 @@ class WindowsVoiceApp:
             messagebox.showerror("参数错误", "服务端端口必须是数字")
             return
 
-        self.server = VoiceRelayServer(host=host, port=port)
+        multicast = self.server_multicast_var.get()
+        self.server = VoiceRelayServer(host=host, port=port, multicast=multicast)
 
         def _server_worker() -> None:
             try:
@@ -144,7 +179,7 @@ class WindowsVoiceApp:
         self.server_thread = threading.Thread(target=_server_worker, daemon=True)
         self.server_thread.start()
         self._set_server_state(True)
-        self._append_log(f"服务端已启动: {host}:{port}")
+        self._append_log(f"服务端已启动: {host}:{port}" + ("（组播分发）" if multicast else ""))
 
     def stop_server(self) -> None:
         if self.server is not None:
@@ -160,6 +195,7 @@ class WindowsVoiceApp:
         host = self.host_var.get().strip()
         room = self.room_var.get().strip()
         name = self.name_var.get().strip() or socket.gethostname()
+        multicast = self.multicast_var.get()
 
         if not host or not room:
             messagebox.showerror("参数错误", "服务端 IP 与房间不能为空")
@@ -175,12 +211,15 @@ class WindowsVoiceApp:
 
         def _connect_worker() -> None:
             try:
+                from client import VoiceClient
+
                 self.client = VoiceClient(
                     host=host,
                     port=port,
                     room=room,
                     name=name,
                     on_system_message=self._append_log,
+                    multicast=multicast,
                 )
                 self.client.start()
                 self.root.after(0, lambda: self._set_state(True))